@@ -6,21 +6,29 @@ Docker 镜像加速器测试 Web 应用
 """
 
 from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-import urllib.request
-import urllib.error
+import urllib3
+import heapq
 import json
+import queue
 import threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 import os
 import shutil
+import socket
 import subprocess
+import time
+from functools import lru_cache
 from datetime import datetime, timedelta
+from decimal import Decimal
 from typing import Dict, List, Tuple, Optional
 import redis
 import pymysql
+from apscheduler.schedulers.background import BackgroundScheduler
 from pymysql.cursors import DictCursor
 import asyncio
 from contextlib import asynccontextmanager
@@ -79,8 +87,60 @@ test_results_cache: Dict = {
     "next_update": None
 }
 
-# 定时任务锁，防止并发测试
-test_lock = threading.Lock()
+# 定时任务调度器（单个常驻线程，并发保护由 max_instances=1 提供）
+scheduler = BackgroundScheduler()
+
+# 共享线程池（限制并发数，避免每个批次都新建 19 个线程）
+EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix='mirror')
+
+# 单个批次的全局等待上限（秒）
+BATCH_DEADLINE = 12
+
+# DNS 解析缓存有效期（秒）：同一批镜像每小时重复解析一次即可
+DNS_CACHE_TTL = 3600
+
+# 不缓存 MySQL/Redis 的解析结果：它们是 compose 服务名，容器重启后 IP 会变，
+# 缓存会让重连在 TTL 内一直拨打旧地址
+DNS_CACHE_BYPASS_HOSTS = frozenset({MYSQL_CONFIG['host'], REDIS_CONFIG['host']})
+
+_real_getaddrinfo = socket.getaddrinfo
+
+
+@lru_cache(maxsize=256)
+def _cached_getaddrinfo(host, port, family, type, proto, flags, ttl_bucket):
+    # ttl_bucket 只用于让缓存项在 TTL 后自然失效
+    return _real_getaddrinfo(host, port, family, type, proto, flags)
+
+
+def _getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """带 TTL 的进程内 DNS 缓存，探测同一批镜像时跳过重复解析"""
+    if host in DNS_CACHE_BYPASS_HOSTS:
+        return _real_getaddrinfo(host, port, family, type, proto, flags)
+
+    ttl_bucket = int(time.time() // DNS_CACHE_TTL)
+    try:
+        return _cached_getaddrinfo(host, port, family, type, proto, flags, ttl_bucket)
+    except TypeError:
+        # 参数不可哈希时直接走原始解析
+        return _real_getaddrinfo(host, port, family, type, proto, flags)
+
+
+socket.getaddrinfo = _getaddrinfo
+
+# 表示服务可用的 HTTP 状态码
+_OK_CODES = frozenset({200, 301, 302, 401, 403, 404})
+
+# 需要退回 GET 重试的状态码（服务不支持 HEAD）
+_HEAD_RETRY_CODES = frozenset({405, 501})
+
+# HTTP 连接池（按主机复用 TCP/TLS 连接，避免每次探测重新握手）
+HTTP = urllib3.PoolManager(
+    num_pools=64,
+    maxsize=4,
+    timeout=urllib3.Timeout(connect=2, read=5),
+    retries=False,
+    headers={'User-Agent': 'Docker-Mirror-Checker/1.0'}
+)
 
 
 @asynccontextmanager
@@ -103,8 +163,10 @@ async def lifespan(app: FastAPI):
     start_scheduled_test()
     
     yield
-    
+
     # 关闭时清理
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
     if redis_pool:
         redis_pool.disconnect()
 
@@ -116,22 +178,97 @@ app.router.lifespan_context = lifespan
 def init_redis():
     global redis_pool, redis_client
     try:
-        redis_pool = redis.ConnectionPool(**REDIS_CONFIG)
+        # 显式限制连接数并开启 keepalive，避免并发请求时无限扩张连接
+        redis_pool = redis.ConnectionPool(
+            max_connections=32,
+            socket_keepalive=True,
+            socket_timeout=1,
+            health_check_interval=30,
+            **REDIS_CONFIG
+        )
         redis_client = redis.Redis(connection_pool=redis_pool)
         redis_client.ping()
         print("Redis 连接成功")
+
+        # 订阅缓存更新消息，缓存一旦写入立即刷新内存副本
+        listener = threading.Thread(target=_cache_update_listener, daemon=True)
+        listener.start()
     except Exception as e:
         print(f"Redis 连接失败: {e}")
         redis_client = None
 
 
-# 获取 MySQL 连接
-def get_mysql_connection():
+def _cache_update_listener():
+    """订阅 mirror_updates 频道，收到消息后刷新内存缓存"""
+    global test_results_cache
+
     try:
-        return pymysql.connect(**MYSQL_CONFIG)
+        # 订阅需要长期阻塞，使用不带 socket_timeout 的独立连接
+        sub_client = redis.Redis(**REDIS_CONFIG)
+        pubsub = sub_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("mirror_updates")
+        for message in pubsub.listen():
+            try:
+                cached = get_from_redis()
+                if cached:
+                    test_results_cache = cached
+            except Exception as e:
+                print(f"刷新内存缓存失败: {e}")
     except Exception as e:
-        print(f"MySQL 连接失败: {e}")
-        return None
+        print(f"缓存更新订阅失败: {e}")
+
+
+# MySQL 连接池（复用连接，避免每次查询都重新 TCP + 认证握手）
+class MySQLConnectionPool:
+    def __init__(self, maxsize: int = 10):
+        self._pool = queue.LifoQueue(maxsize=maxsize)
+
+    def get_connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+
+        if conn is not None:
+            try:
+                # 检查连接是否仍然有效（丢弃被 wait_timeout 关闭的连接）
+                conn.ping(reconnect=True)
+                return conn
+            except Exception:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+        try:
+            return pymysql.connect(**MYSQL_CONFIG)
+        except Exception as e:
+            print(f"MySQL 连接失败: {e}")
+            return None
+
+    def release(self, conn):
+        if conn is None:
+            return
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+mysql_pool = MySQLConnectionPool(maxsize=10)
+
+
+# 获取 MySQL 连接（从连接池）
+def get_mysql_connection():
+    return mysql_pool.get_connection()
+
+
+# 归还 MySQL 连接到连接池
+def release_mysql_connection(conn):
+    mysql_pool.release(conn)
 
 
 # 默认镜像站列表（当配置文件不存在时使用）
@@ -187,37 +324,48 @@ def load_mirrors_from_config() -> List[str]:
 DEFAULT_MIRRORS = load_mirrors_from_config()
 
 
+def _probe_status(test_url: str, timeout: int, method: str = 'HEAD') -> int:
+    """探测单个 URL，只返回 HTTP 状态码（不读取响应体）"""
+    response = HTTP.request(
+        method, test_url,
+        timeout=urllib3.Timeout(connect=2, read=timeout),
+        preload_content=False
+    )
+    try:
+        return response.status
+    finally:
+        # 不读取响应体，直接把连接放回池里复用
+        response.release_conn()
+
+
 def test_mirror(mirror: str, timeout: int = 5) -> Tuple[bool, str, int]:
     """
     测试镜像加速器是否可用
     返回: (是否可用, 状态信息, HTTP状态码)
+    先探测 /v2/，只有连接层失败才回退探测根路径（有 HTTP 应答即可判定）
     """
     test_urls = [
         f"{mirror}/v2/",
         f"{mirror}",
     ]
-    
+
     for test_url in test_urls:
         try:
-            req = urllib.request.Request(test_url)
-            req.add_header('User-Agent', 'Docker-Mirror-Checker/1.0')
-            with urllib.request.urlopen(req, timeout=timeout) as response:
-                status_code = response.getcode()
-                # 200, 301, 302, 401, 404 都表示服务可用
-                if status_code in [200, 301, 302, 401, 404]:
-                    return True, "可用", status_code
-                elif status_code == 403:
-                    return True, "可用（需要认证）", status_code
-        except urllib.error.HTTPError as e:
-            # HTTP 错误但服务存在
-            if e.code in [401, 403, 404]:
-                return True, f"可用（HTTP {e.code}）", e.code
-            return False, f"HTTP 错误: {e.code}", e.code
-        except urllib.error.URLError as e:
-            continue
+            # 只需要状态码，用 HEAD 避免传输响应体
+            status_code = _probe_status(test_url, timeout)
+            if status_code in _HEAD_RETRY_CODES:
+                # 个别服务不支持 HEAD，退回 GET 重试一次
+                status_code = _probe_status(test_url, timeout, method='GET')
         except Exception as e:
+            # 连接层失败（超时、拒绝连接等），尝试下一个地址
             continue
-    
+
+        if status_code in _OK_CODES:
+            status_msg = "可用" if status_code == 200 else f"可用（HTTP {status_code}）"
+            return True, status_msg, status_code
+        # 有 HTTP 应答但状态码不可接受，根路径也不会有不同结论
+        return False, f"HTTP 错误: {status_code}", status_code
+
     return False, "连接失败", 0
 
 
@@ -234,104 +382,183 @@ def test_mirror_detailed(mirror: str, timeout: int = 5, save_to_db: bool = True)
         "status": status_msg,
         "status_code": status_code,
         "response_time": round(response_time, 2),
-        "test_time": end_time.strftime("%Y-%m-%d %H:%M:%S")
+        "test_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        # 原始 datetime 对象，供数据库写入直接使用（不进入 JSON 输出）
+        "test_time_dt": end_time
     }
-    
+
     # 保存到数据库
     if save_to_db:
         save_test_result_to_db(result)
-    
+        result.pop('test_time_dt', None)
+
     return result
 
 
+# 测试历史记录插入语句
+SQL_INSERT_HISTORY = """
+    INSERT INTO mirror_test_history
+    (mirror_url, available, status, status_code, response_time, test_time)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+# 统计信息更新语句（UPDATE 子句通过 VALUES() 引用插入值，参数只传一遍）
+SQL_UPSERT_STATISTICS = """
+    INSERT INTO mirror_statistics
+    (mirror_url, total_tests, success_count, fail_count, avg_response_time,
+     last_success_time, last_fail_time, current_status)
+    VALUES (%s, 1, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        avg_response_time = (avg_response_time * total_tests + VALUES(avg_response_time))
+                            / (total_tests + 1),
+        total_tests = total_tests + 1,
+        success_count = success_count + VALUES(success_count),
+        fail_count = fail_count + VALUES(fail_count),
+        last_success_time = IFNULL(VALUES(last_success_time), last_success_time),
+        last_fail_time = IFNULL(VALUES(last_fail_time), last_fail_time),
+        current_status = VALUES(current_status)
+"""
+
+
+def _result_test_time(result: Dict) -> datetime:
+    """取测试时间，优先用原始 datetime 对象，避免字符串来回转换"""
+    test_time = result.get('test_time_dt')
+    if test_time is None:
+        test_time = datetime.strptime(result['test_time'], '%Y-%m-%d %H:%M:%S')
+    return test_time
+
+
+def _history_row(result: Dict) -> Tuple:
+    """构造 mirror_test_history 的参数行"""
+    return (
+        result['mirror'],
+        result['available'],
+        result['status'],
+        result['status_code'],
+        result['response_time'],
+        _result_test_time(result)
+    )
+
+
+def _statistics_row(result: Dict) -> Tuple:
+    """构造 mirror_statistics 的参数行"""
+    test_time = _result_test_time(result)
+    success = 1 if result['available'] else 0
+    return (
+        result['mirror'],
+        success,
+        1 - success,
+        result['response_time'],
+        test_time if result['available'] else None,
+        test_time if not result['available'] else None,
+        result['available']
+    )
+
+
 def save_test_result_to_db(result: Dict):
     """保存测试结果到 MySQL"""
     conn = get_mysql_connection()
     if not conn:
         return
-    
+
     try:
         with conn.cursor() as cursor:
             # 插入测试历史记录
-            sql = """
-                INSERT INTO mirror_test_history 
-                (mirror_url, available, status, status_code, response_time, test_time)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(sql, (
-                result['mirror'],
-                result['available'],
-                result['status'],
-                result['status_code'],
-                result['response_time'],
-                datetime.strptime(result['test_time'], '%Y-%m-%d %H:%M:%S')
-            ))
-            
+            cursor.execute(SQL_INSERT_HISTORY, _history_row(result))
+
             # 更新统计信息
-            sql_stat = """
-                INSERT INTO mirror_statistics 
-                (mirror_url, total_tests, success_count, fail_count, avg_response_time, 
-                 last_success_time, last_fail_time, current_status)
-                VALUES (%s, 1, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    total_tests = total_tests + 1,
-                    success_count = success_count + %s,
-                    fail_count = fail_count + %s,
-                    avg_response_time = (avg_response_time * (total_tests - 1) + %s) / total_tests,
-                    last_success_time = IF(%s = 1, %s, last_success_time),
-                    last_fail_time = IF(%s = 0, %s, last_fail_time),
-                    current_status = %s
-            """
-            test_time = datetime.strptime(result['test_time'], '%Y-%m-%d %H:%M:%S')
-            cursor.execute(sql_stat, (
-                result['mirror'],
-                1 if result['available'] else 0,
-                0 if result['available'] else 1,
-                result['response_time'],
-                test_time if result['available'] else None,
-                test_time if not result['available'] else None,
-                result['available'],
-                1 if result['available'] else 0,
-                0 if result['available'] else 1,
-                result['response_time'],
-                1 if result['available'] else 0,
-                test_time,
-                1 if result['available'] else 0,
-                test_time,
-                result['available']
-            ))
-        
+            cursor.execute(SQL_UPSERT_STATISTICS, _statistics_row(result))
+
         conn.commit()
     except Exception as e:
         print(f"保存到数据库失败: {e}")
         conn.rollback()
     finally:
-        conn.close()
+        release_mysql_connection(conn)
+
+
+def save_batch_results_to_db(results: List[Dict]):
+    """批量保存测试结果到 MySQL（整批一次提交，减少数据库往返）"""
+    if not results:
+        return
+
+    conn = get_mysql_connection()
+    if not conn:
+        return
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(SQL_INSERT_HISTORY, [_history_row(r) for r in results])
+            cursor.executemany(SQL_UPSERT_STATISTICS, [_statistics_row(r) for r in results])
+
+        conn.commit()
+    except Exception as e:
+        print(f"批量保存到数据库失败: {e}")
+        conn.rollback()
+    finally:
+        release_mysql_connection(conn)
+
+
+def update_mirror_rank(results: List[Dict]):
+    """把本次结果写入 Redis 排名（按响应时间，失败的排到最后）"""
+    if not redis_client:
+        return
+
+    try:
+        scores = {
+            r['mirror']: (r['response_time'] if r['available'] else 999999.0)
+            for r in results
+        }
+        if scores:
+            redis_client.zadd("mirror:last_good_rank", scores)
+    except Exception as e:
+        print(f"更新镜像排名失败: {e}")
+
+
+def order_mirrors_by_rank(mirrors: List[str]) -> List[str]:
+    """按上次检测的响应时间排序，已知较快的镜像先进入线程池"""
+    if not redis_client:
+        return mirrors
+
+    try:
+        ranked = redis_client.zrange("mirror:last_good_rank", 0, -1)
+        rank = {m: i for i, m in enumerate(ranked)}
+        unknown = len(rank)
+        return sorted(mirrors, key=lambda m: rank.get(m, unknown))
+    except Exception as e:
+        print(f"读取镜像排名失败: {e}")
+        return mirrors
 
 
 def test_all_mirrors_background(mirrors: List[str] = None, save_to_db: bool = True) -> Dict:
     """后台测试所有镜像站（用于定时任务）"""
     if mirrors is None:
         mirrors = DEFAULT_MIRRORS
-    
-    results = []
+
+    # 按历史表现排序，快的镜像先占用线程池工作线程
+    mirrors = order_mirrors_by_rank(mirrors)
+
     batch_time = datetime.now()
-    
-    # 使用线程池并行测试
-    def test_worker(mirror):
-        result = test_mirror_detailed(mirror, save_to_db=save_to_db)
-        results.append(result)
-    
-    threads = []
-    for mirror in mirrors:
-        thread = threading.Thread(target=test_worker, args=(mirror,))
-        thread.start()
-        threads.append(thread)
-    
-    # 等待所有线程完成
-    for thread in threads:
-        thread.join(timeout=10)  # 每个线程最多等待10秒
-    
+
+    # 使用共享线程池并行测试，结果由调用方统一收集（工作线程不写共享列表）
+    # 数据库写入在批次结束后统一批量执行，不在工作线程里逐条提交
+    futures = [
+        EXECUTOR.submit(test_mirror_detailed, mirror, save_to_db=False)
+        for mirror in mirrors
+    ]
+
+    # 整个批次统一等待，超时未完成的任务直接放弃
+    done, not_done = concurrent.futures.wait(futures, timeout=BATCH_DEADLINE)
+    for future in not_done:
+        future.cancel()
+
+    results = []
+    for future in done:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            print(f"镜像检测任务异常: {e}")
+
     # 按可用性排序：可用的在前
     results.sort(key=lambda x: (not x['available'], x['response_time']))
     
@@ -342,10 +569,18 @@ def test_all_mirrors_background(mirrors: List[str] = None, save_to_db: bool = Tr
         "unavailable": sum(1 for r in results if not r['available'])
     }
     
-    # 保存批次信息到数据库
+    # 批量保存测试结果和批次信息到数据库
     if save_to_db:
+        save_batch_results_to_db(results)
         save_batch_to_db(batch_time, test_result)
-    
+
+    # 移除内部字段，避免进入 Redis 缓存和 JSON 输出
+    for r in results:
+        r.pop('test_time_dt', None)
+
+    # 更新排名，供下一个批次调整探测顺序
+    update_mirror_rank(results)
+
     # 缓存到 Redis（1小时过期）
     cache_to_redis(test_result)
     
@@ -380,7 +615,7 @@ def save_batch_to_db(batch_time: datetime, test_result: Dict):
         print(f"保存批次信息失败: {e}")
         conn.rollback()
     finally:
-        conn.close()
+        release_mysql_connection(conn)
 
 
 def cache_to_redis(data: Dict):
@@ -398,45 +633,57 @@ def cache_to_redis(data: Dict):
             "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "next_update": (datetime.now() + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
         }
-        redis_client.setex(
-            cache_key,
-            3600,  # 1小时过期
-            json.dumps(cache_data, ensure_ascii=False)
-        )
+        # 管道一次提交两个写入，省一次往返
+        with redis_client.pipeline(transaction=False) as pipe:
+            pipe.setex(
+                cache_key,
+                3600,  # 1小时过期
+                json.dumps(cache_data, ensure_ascii=False)
+            )
+            pipe.set("mirror_test_last_update", cache_data["last_update"])
+            # 广播更新事件，订阅方立即刷新各自的内存缓存
+            pipe.publish("mirror_updates", cache_data["last_update"])
+            pipe.execute()
     except Exception as e:
         print(f"Redis 缓存失败: {e}")
 
 
-def get_from_redis() -> Optional[Dict]:
-    """从 Redis 获取缓存数据"""
+def get_from_redis_raw() -> Optional[str]:
+    """从 Redis 获取缓存的原始 JSON 字符串（不反序列化）"""
     if not redis_client:
         return None
-    
+
     try:
         cache_key = "mirror_test_results"
-        cached = redis_client.get(cache_key)
-        if cached:
-            return json.loads(cached)
+        return redis_client.get(cache_key)
     except Exception as e:
         print(f"从 Redis 获取数据失败: {e}")
-    
+
+    return None
+
+
+def get_from_redis() -> Optional[Dict]:
+    """从 Redis 获取缓存数据"""
+    cached = get_from_redis_raw()
+    if cached:
+        return json.loads(cached)
     return None
 
 
 def auto_update_docker_config(test_result: Dict):
     """自动更新 Docker daemon.json 配置"""
     try:
-        # 筛选可用的镜像源
-        available = [r for r in test_result.get("results", []) if r.get('available', False)]
-        
-        if not available:
+        # 从可用的镜像源中选出响应最快的 5 个（无需全量排序）
+        recommended = heapq.nsmallest(
+            5,
+            (r for r in test_result.get("results", []) if r.get('available', False)),
+            key=lambda r: r.get('response_time', 9999)
+        )
+
+        if not recommended:
             print("没有可用的镜像源，跳过配置更新")
             return
         
-        # 按响应时间排序，选择最快的 5 个
-        sorted_available = sorted(available, key=lambda x: x.get('response_time', 9999))
-        recommended = sorted_available[:5]
-        
         # 生成配置
         config = {
             "registry-mirrors": [r['mirror'] for r in recommended]
@@ -452,14 +699,6 @@ def auto_update_docker_config(test_result: Dict):
                 print(f"创建配置目录失败: {e}")
                 return
         
-        # 备份现有配置
-        if os.path.exists(DOCKER_DAEMON_JSON):
-            try:
-                shutil.copy2(DOCKER_DAEMON_JSON, DOCKER_DAEMON_JSON_BACKUP)
-                print(f"已备份现有配置到: {DOCKER_DAEMON_JSON_BACKUP}")
-            except Exception as e:
-                print(f"备份配置失败: {e}")
-        
         # 读取现有配置（如果存在）
         existing_config = {}
         if os.path.exists(DOCKER_DAEMON_JSON):
@@ -468,14 +707,29 @@ def auto_update_docker_config(test_result: Dict):
                     existing_config = json.load(f)
             except Exception as e:
                 print(f"读取现有配置失败: {e}，将创建新配置")
-        
+
+        # 镜像源列表没有变化时跳过写入和重启提示（每小时检测大多属于这种情况）
+        if existing_config.get("registry-mirrors") == config["registry-mirrors"]:
+            print("镜像源列表无变化，跳过配置更新")
+            return
+
+        # 备份现有配置
+        if os.path.exists(DOCKER_DAEMON_JSON):
+            try:
+                shutil.copy2(DOCKER_DAEMON_JSON, DOCKER_DAEMON_JSON_BACKUP)
+                print(f"已备份现有配置到: {DOCKER_DAEMON_JSON_BACKUP}")
+            except Exception as e:
+                print(f"备份配置失败: {e}")
+
         # 合并配置（保留其他设置）
         existing_config["registry-mirrors"] = config["registry-mirrors"]
-        
-        # 写入新配置
+
+        # 写入新配置：先写临时文件再原子替换，避免进程中断时留下残缺的 daemon.json
         try:
-            with open(DOCKER_DAEMON_JSON, 'w', encoding='utf-8') as f:
+            tmp_path = DOCKER_DAEMON_JSON + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(existing_config, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, DOCKER_DAEMON_JSON)
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✅ Docker 配置已自动更新: {DOCKER_DAEMON_JSON}")
             print(f"已配置 {len(recommended)} 个镜像源: {', '.join([r['mirror'] for r in recommended])}")
             
@@ -511,44 +765,44 @@ def restart_docker_service():
 def scheduled_test():
     """定时测试任务（每1小时执行一次）"""
     global test_results_cache
-    
-    if test_lock.acquire(blocking=False):
-        try:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始定时检测镜像源状态...")
-            
-            # 执行测试（保存到数据库）
-            test_result = test_all_mirrors_background(save_to_db=True)
-            
-            # 更新内存缓存
-            now = datetime.now()
-            next_update = datetime.fromtimestamp(now.timestamp() + 3600)  # 1小时后
-            
-            test_results_cache = {
-                "results": test_result["results"],
-                "total": test_result["total"],
-                "available": test_result["available"],
-                "unavailable": test_result["unavailable"],
-                "last_update": now.strftime("%Y-%m-%d %H:%M:%S"),
-                "next_update": next_update.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 定时检测完成: 可用 {test_result['available']}/{test_result['total']} 个镜像源")
-            
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 定时检测出错: {str(e)}")
-        finally:
-            test_lock.release()
-    
-    # 安排下一次测试（1小时后）
-    timer = threading.Timer(3600.0, scheduled_test)
-    timer.daemon = True
-    timer.start()
+
+    try:
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始定时检测镜像源状态...")
+
+        # 执行测试（保存到数据库）
+        test_result = test_all_mirrors_background(save_to_db=True)
+
+        # 更新内存缓存
+        now = datetime.now()
+        next_update = datetime.fromtimestamp(now.timestamp() + 3600)  # 1小时后
+
+        test_results_cache = {
+            "results": test_result["results"],
+            "total": test_result["total"],
+            "available": test_result["available"],
+            "unavailable": test_result["unavailable"],
+            "last_update": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "next_update": next_update.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 定时检测完成: 可用 {test_result['available']}/{test_result['total']} 个镜像源")
+
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 定时检测出错: {str(e)}")
 
 
 def start_scheduled_test():
     """启动定时测试任务"""
-    # 立即执行一次测试
-    scheduled_test()
+    # 立即执行一次，之后每小时一次；max_instances=1 防止并发测试
+    scheduler.add_job(
+        scheduled_test,
+        'interval',
+        hours=1,
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True
+    )
+    scheduler.start()
 
 
 # FastAPI 路由
@@ -578,8 +832,9 @@ async def test_single(request: Request):
     
     if not mirror:
         raise HTTPException(status_code=400, detail="缺少 mirror 参数")
-    
-    result = test_mirror_detailed(mirror)
+
+    # 探测是阻塞 IO，放到线程池执行，不占用事件循环
+    result = await asyncio.wrap_future(EXECUTOR.submit(test_mirror_detailed, mirror))
     return result
 
 
@@ -593,41 +848,51 @@ async def test_all(request: Request):
         raise HTTPException(status_code=400, detail="mirrors 必须是列表")
     
     results = []
-    
-    # 使用线程池并行测试（限制并发数）
-    def test_worker(mirror):
-        result = test_mirror_detailed(mirror)
-        results.append(result)
-    
-    threads = []
-    for mirror in mirrors:
-        thread = threading.Thread(target=test_worker, args=(mirror,))
-        thread.start()
-        threads.append(thread)
-    
-    # 等待所有线程完成
-    for thread in threads:
-        thread.join(timeout=10)  # 每个线程最多等待10秒
-    
+
+    if mirrors:
+        # 使用共享线程池并行测试（限制并发数），结果由调用方统一收集
+        futures = [EXECUTOR.submit(test_mirror_detailed, mirror) for mirror in mirrors]
+
+        # 整个批次统一等待（异步等待，不阻塞事件循环），超时未完成的任务直接放弃
+        # 空列表直接跳过（asyncio.wait 不接受空集合）
+        done, pending = await asyncio.wait(
+            [asyncio.wrap_future(future) for future in futures],
+            timeout=BATCH_DEADLINE
+        )
+        for task in pending:
+            task.cancel()
+
+        for task in done:
+            try:
+                results.append(task.result())
+            except Exception as e:
+                print(f"镜像检测任务异常: {e}")
+
     # 按可用性排序：可用的在前
     results.sort(key=lambda x: (not x['available'], x['response_time']))
-    
-    return {
+
+    test_result = {
         "results": results,
         "total": len(results),
         "available": sum(1 for r in results if r['available']),
         "unavailable": sum(1 for r in results if not r['available'])
     }
 
+    # 手动全量测试的结果同样写入缓存并广播更新（自定义列表不覆盖缓存）
+    if mirrors == DEFAULT_MIRRORS:
+        cache_to_redis(test_result)
+
+    return test_result
+
 
 @app.get("/api/test/cached")
 async def get_cached_results():
     """获取缓存的测试结果（优先从 Redis，其次内存缓存）"""
-    # 先尝试从 Redis 获取
-    redis_data = get_from_redis()
-    if redis_data:
-        return redis_data
-    
+    # 先尝试从 Redis 获取，缓存的 JSON 原样返回，省去反序列化再序列化
+    raw = get_from_redis_raw()
+    if raw:
+        return Response(content=raw, media_type="application/json")
+
     # 如果 Redis 没有，使用内存缓存
     return test_results_cache
 
@@ -662,9 +927,8 @@ async def get_recommended_config():
             "config": None
         }
     
-    # 按响应时间排序，选择最快的 5 个
-    sorted_available = sorted(available, key=lambda x: x.get('response_time', 9999))
-    recommended = sorted_available[:5]
+    # 选择响应最快的 5 个（无需全量排序）
+    recommended = heapq.nsmallest(5, available, key=lambda x: x.get('response_time', 9999))
     
     # 生成配置
     config = {
@@ -720,77 +984,76 @@ async def update_docker_config_manual():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/history")
-async def get_history(mirror: str = None, limit: int = 100):
-    """获取历史检测记录"""
+def _json_default(value):
+    """JSON 序列化兜底：Decimal 转数值，datetime 等其他类型转字符串"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _stream_query_as_json(sql: str, params: Tuple, json_key: str) -> StreamingResponse:
+    """用服务端游标执行查询，逐行序列化为 JSON 流式输出"""
     conn = get_mysql_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="数据库连接失败")
-    
+
     try:
-        with conn.cursor() as cursor:
-            if mirror:
-                sql = """
-                    SELECT * FROM mirror_test_history 
-                    WHERE mirror_url = %s 
-                    ORDER BY test_time DESC 
-                    LIMIT %s
-                """
-                cursor.execute(sql, (mirror, limit))
-            else:
-                sql = """
-                    SELECT * FROM mirror_test_history 
-                    ORDER BY test_time DESC 
-                    LIMIT %s
-                """
-                cursor.execute(sql, (limit,))
-            
-            results = cursor.fetchall()
-            
-            # 转换 datetime 为字符串
-            for r in results:
-                if r.get('test_time'):
-                    r['test_time'] = r['test_time'].strftime('%Y-%m-%d %H:%M:%S')
-                if r.get('created_at'):
-                    r['created_at'] = r['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            
-            return {"history": results}
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(sql, params)
     except Exception as e:
+        release_mysql_connection(conn)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+    def row_stream():
+        try:
+            yield f'{{"{json_key}": ['
+            first = True
+            for row in cursor:
+                prefix = '' if first else ','
+                first = False
+                yield prefix + json.dumps(row, ensure_ascii=False, default=_json_default)
+            yield ']}'
+        finally:
+            cursor.close()
+            release_mysql_connection(conn)
+
+    return StreamingResponse(row_stream(), media_type="application/json")
+
+
+@app.get("/api/history")
+async def get_history(mirror: str = None, limit: int = 100):
+    """获取历史检测记录（流式输出，不在请求线程里攒全量结果）"""
+    if mirror:
+        sql = """
+            SELECT id, mirror_url, available, status, status_code,
+                   response_time, test_time, created_at
+            FROM mirror_test_history
+            WHERE mirror_url = %s
+            ORDER BY test_time DESC
+            LIMIT %s
+        """
+        params = (mirror, limit)
+    else:
+        sql = """
+            SELECT id, mirror_url, available, status, status_code,
+                   response_time, test_time, created_at
+            FROM mirror_test_history
+            ORDER BY test_time DESC
+            LIMIT %s
+        """
+        params = (limit,)
+
+    return _stream_query_as_json(sql, params, "history")
 
 
 @app.get("/api/statistics")
 async def get_statistics():
-    """获取镜像源统计信息"""
-    conn = get_mysql_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="数据库连接失败")
-    
-    try:
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT * FROM mirror_statistics 
-                ORDER BY success_count DESC, avg_response_time ASC
-            """
-            cursor.execute(sql)
-            results = cursor.fetchall()
-            
-            # 转换 datetime 为字符串
-            for r in results:
-                if r.get('last_success_time'):
-                    r['last_success_time'] = r['last_success_time'].strftime('%Y-%m-%d %H:%M:%S')
-                if r.get('last_fail_time'):
-                    r['last_fail_time'] = r['last_fail_time'].strftime('%Y-%m-%d %H:%M:%S')
-                if r.get('updated_at'):
-                    r['updated_at'] = r['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
-            
-            return {"statistics": results}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+    """获取镜像源统计信息（流式输出）"""
+    sql = """
+        SELECT * FROM mirror_statistics
+        ORDER BY success_count DESC, avg_response_time ASC
+    """
+    return _stream_query_as_json(sql, (), "statistics")
 
 
 @app.post("/api/test/batch")
@@ -803,22 +1066,36 @@ async def test_batch(request: Request):
         raise HTTPException(status_code=400, detail="mirrors 必须是列表")
     
     async def event_generator():
+        # 全部提交到共享线程池并行探测，谁先完成先推送
+        futures = [
+            asyncio.wrap_future(EXECUTOR.submit(test_mirror_detailed, mirror))
+            for mirror in mirrors
+        ]
+
         results = []
         completed = 0
-        
-        for mirror in mirrors:
-            result = test_mirror_detailed(mirror)
+
+        for task in asyncio.as_completed(futures):
+            try:
+                result = await task
+            except Exception as e:
+                print(f"镜像检测任务异常: {e}")
+                continue
             results.append(result)
             completed += 1
-            
+
             # 返回进度（流式响应）
             yield f"data: {json.dumps({'progress': completed, 'total': len(mirrors), 'result': result}, ensure_ascii=False)}\n\n"
-        
+
         # 最终结果
         results.sort(key=lambda x: (not x['available'], x['response_time']))
         yield f"data: {json.dumps({'done': True, 'results': results, 'total': len(results), 'available': sum(1 for r in results if r['available']), 'unavailable': sum(1 for r in results if not r['available'])}, ensure_ascii=False)}\n\n"
-    
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no"}  # 关闭反向代理缓冲，保证进度实时到达
+    )
 
 
 @app.get("/api/health")
@@ -10,7 +10,9 @@ CREATE TABLE IF NOT EXISTS mirror_test_history (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_mirror_url (mirror_url),
     INDEX idx_test_time (test_time),
-    INDEX idx_available (available)
+    INDEX idx_available (available),
+    -- 按镜像查询历史记录时避免全表排序（ORDER BY test_time DESC LIMIT n）
+    INDEX idx_mirror_time (mirror_url, test_time DESC)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 创建镜像源统计表
@@ -9,8 +9,7 @@ Docker 镜像加速器测试和配置脚本
 import json
 import sys
 import os
-import urllib.request
-import urllib.error
+import urllib3
 from typing import List, Set
 
 # 颜色输出
@@ -33,26 +32,59 @@ MIRRORS = [
 
 DAEMON_JSON = "/etc/docker/daemon.json"
 
+# 表示服务可用的 HTTP 状态码
+_OK_CODES = frozenset({200, 301, 302, 401, 404})
+
+# 需要退回 GET 重试的状态码（服务不支持 HEAD）
+_HEAD_RETRY_CODES = frozenset({405, 501})
+
+# HTTP 连接池（按主机复用 TCP/TLS 连接，避免每次探测重新握手）
+HTTP = urllib3.PoolManager(
+    num_pools=64,
+    maxsize=4,
+    timeout=urllib3.Timeout(connect=2, read=5),
+    retries=False,
+    headers={'User-Agent': 'Docker-Mirror-Test/1.0'}
+)
+
+
+def _probe_status(test_url: str, timeout: int, method: str = 'HEAD') -> int:
+    """探测单个 URL，只返回 HTTP 状态码（不读取响应体）"""
+    response = HTTP.request(
+        method, test_url,
+        timeout=urllib3.Timeout(connect=2, read=timeout),
+        preload_content=False
+    )
+    try:
+        return response.status
+    finally:
+        # 不读取响应体，直接把连接放回池里复用
+        response.release_conn()
+
 
 def test_mirror(mirror: str, timeout: int = 5) -> bool:
-    """测试镜像加速器是否可用"""
+    """测试镜像加速器是否可用（只有连接层失败才回退探测根路径）"""
     test_urls = [
         f"{mirror}/v2/",
         f"{mirror}",
     ]
-    
+
     for test_url in test_urls:
         try:
-            req = urllib.request.Request(test_url)
-            req.add_header('User-Agent', 'Docker-Mirror-Test/1.0')
-            with urllib.request.urlopen(req, timeout=timeout) as response:
-                status_code = response.getcode()
-                # 200, 401, 404 都表示服务可用
-                if status_code in [200, 301, 302, 401, 404]:
-                    return True, status_code
-        except (urllib.error.URLError, urllib.error.HTTPError, Exception) as e:
+            # 只需要状态码，用 HEAD 避免传输响应体
+            status_code = _probe_status(test_url, timeout)
+            if status_code in _HEAD_RETRY_CODES:
+                # 个别服务不支持 HEAD，退回 GET 重试一次
+                status_code = _probe_status(test_url, timeout, method='GET')
+        except Exception as e:
+            # 连接层失败（超时、拒绝连接等），尝试下一个地址
             continue
-    
+
+        if status_code in _OK_CODES:
+            return True, status_code
+        # 有 HTTP 应答但状态码不可接受，根路径也不会有不同结论
+        return False, None
+
     return False, None
 
 